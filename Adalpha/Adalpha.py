@@ -3,9 +3,119 @@ from keras.optimizers import Optimizer
 import numpy as np
 import matplotlib.pyplot as plt
 
+
+def _m_activ(m):
+    """Activate the momentum and velocity of Adam to increase the convergence of low momentum weights.
+    :param m: the value being activated, any Tensorflow.math compatible Tensorflow Tensor
+    :return: the activated value - Tensorflow Tensor of same input type
+    """
+    # One pass over m: the std comes from E[m^2] - E[m]^2 instead of a second reduction.
+    mean = tf.reduce_mean(m)
+    meansq = tf.reduce_mean(tf.square(m))
+    std = tf.sqrt(tf.maximum(meansq - tf.square(mean), 0.0))
+    d = tf.abs(tf.abs(mean) - std)
+    c2 = tf.square(0.01 * d)
+    k = 0.1 * tf.square(d)
+    m2 = tf.square(m)
+    ratio = tf.math.divide_no_nan(m2 - c2, m2 + k)
+    t = 2.0 - ratio
+    # t * t rather than tf.pow(t, 2), which some backends lower to exp/log.
+    return m * t * t
+
+
+def _ema_step(loss, a, b, ema_w, change):
+    """One step of the two loss EMAs Adalpha tracks, in plain Python floats.
+    :return: the new a, the new b and their scaled ratio
+    """
+    a = ema_w * loss + (1 - ema_w) * a
+    b = (1 - ema_w) * loss + ema_w * b
+    return a, b, (change * a) / b
+
+
+def _rsqrt_update(num, v, eps_sq):
+    """num * rsqrt(v + eps_sq). float16 goes through float32, where epsilon**2 does not underflow to 0
+    (which would turn a zero gradient into 0 * rsqrt(0) = NaN); eps_sq is a float32 constant in that case.
+    """
+    if v.dtype == tf.float16:
+        return tf.cast(tf.cast(num, tf.float32) * tf.math.rsqrt(tf.cast(v, tf.float32) + eps_sq), tf.float16)
+    return num * tf.math.rsqrt(v + eps_sq)
+
+
+def _adam_step(g, m, v, alpha, omb1, omb2, eps_sq):
+    """Fused dense Adam step; under XLA the whole chain becomes a single elementwise kernel.
+    omb1 and omb2 are 1 - beta_1 and 1 - beta_2, precomputed in the variable dtype. eps_sq is epsilon**2,
+    added inside the square root so the denominator is a single rsqrt.
+    :return: the new momentum, the new velocity and the delta to subtract from the variable
+    """
+    m2 = m + (g - m) * omb1
+    v2 = v + (tf.square(g) - v) * omb2
+    upd = _rsqrt_update(m2 * alpha, v2, eps_sq)
+    return m2, v2, upd
+
+
+def _adalpha_step(g, m, v, alpha, omb1, omb2, eps_sq):
+    """Fused dense Adalpha step, with the momentum activation inlined so XLA can fuse across it.
+    :return: the new momentum, the new velocity and the delta to subtract from the variable
+    """
+    m2 = m + _m_activ((g - m) * omb1)
+    v2 = v + _m_activ((tf.square(g) - v) * omb2)
+    upd = _rsqrt_update(m2 * alpha, v2, eps_sq)
+    return m2, v2, upd
+
+
+def _kernels(step):
+    """Wrap a fused step as a (plain graph, XLA) pair of tf.functions, indexed by the optimizer's jit_compile.
+    With reduce_retracing, variables of different shapes share a trace per dtype instead of each getting its own.
+    """
+    return (
+        tf.function(step, reduce_retracing=True),
+        tf.function(step, jit_compile=True, reduce_retracing=True),
+    )
+
+
+def _flat_adam_step(grads, ms, vs, v_hats, alpha, omb1, omb2, eps_sq):
+    """_adam_step over all variables of one dtype at once, with the flattening, concatenation and splitting
+    inside the function so that under XLA they fuse with the step instead of running as separate ops.
+    :param grads: the dense gradients, in the variable dtype
+    :param ms: the momentum values, in the slot dtype
+    :param vs: the velocity values, in the slot dtype
+    :param v_hats: the amsgrad maximum velocity values, or None without amsgrad
+    :return: the new momentums, velocities and v_hats (None without amsgrad) in the slot dtype, and the
+        deltas to subtract from the variables, each shaped like its variable
+    """
+    dtype = grads[0].dtype
+    sizes = [g.shape.num_elements() for g in grads]
+
+    def flatten(tensors):
+        return tf.cast(tf.concat([tf.reshape(t, [-1]) for t in tensors], axis=0), dtype)
+
+    def split(flat, like):
+        return [tf.cast(tf.reshape(part, t.shape), t.dtype) for part, t in zip(tf.split(flat, sizes), like)]
+
+    m_t, v_t, delta = _adam_step(flatten(grads), flatten(ms), flatten(vs), alpha, omb1, omb2, eps_sq)
+    new_v_hats = None
+    if v_hats is not None:
+        v_hat_t = tf.maximum(flatten(v_hats), v_t)
+        delta = _rsqrt_update(m_t * alpha, v_hat_t, eps_sq)
+        new_v_hats = split(v_hat_t, v_hats)
+    return split(m_t, ms), split(v_t, vs), new_v_hats, split(delta, grads)
+
+
 class AdalphaBase(Optimizer):
     r"""Base class - do not use (yet)
+
+    Note: epsilon is applied inside the square root, m * alpha / sqrt(v + epsilon**2), rather than Adam's
+    m * alpha / (sqrt(v) + epsilon). The two agree unless v is of the order of epsilon**2. For float16
+    variables that denominator is computed in float32, so epsilon**2 does not underflow.
     """
+    # Dense updates are elementwise, so outside of a distribution strategy they are applied as one
+    # fused kernel over all variables of a dtype instead of one small kernel per variable.
+    _supports_flat_update = True
+    # Per-variable moment and delta kernels shared by the dense and sparse paths, see _fused_step.
+    _fused_kernels = _kernels(_adam_step)
+    # The flat update, by jit_compile. No reduce_retracing: the split sizes must be static, and the set of
+    # variable shapes is the same on every step, so each dtype is traced once.
+    _flat_kernels = (tf.function(_flat_adam_step), tf.function(_flat_adam_step, jit_compile=True))
 
     def __init__(
             self,
@@ -26,6 +136,7 @@ class AdalphaBase(Optimizer):
             name="Adam",
             ema_w=0.9,
             change=1,
+            state_dtype=None,
             *args,
             **kwargs
     ):
@@ -44,15 +155,26 @@ class AdalphaBase(Optimizer):
         self._learning_rate = self._build_learning_rate(learning_rate)
         self.beta_1 = beta_1
         self.beta_2 = beta_2
+        self._omb1 = 1.0 - beta_1
+        self._omb2 = 1.0 - beta_2
         self.epsilon = epsilon
+        self._eps_sq = epsilon * epsilon
         self.amsgrad = amsgrad
         self.chaos_punish = adjustment_exp
-        self.std = 1.0
+        # Kept on-device so the compiled update step reads the latest value instead of a traced-in constant.
+        self.std = tf.Variable(1.0, trainable=False, dtype=tf.float32, name="std")
+        # The loss ratio's factor on alpha, computed once per update_loss rather than once per variable.
+        self._chaos_factor = tf.Variable(
+            self._compute_chaos_factor(1.0), trainable=False, dtype=tf.float32, name="chaos_factor"
+        )
         self.loss = 1
         self.ema_w = ema_w
         self.change = change
         self.a = 1
         self.b = 1
+        # Optional storage dtype for the momentum/velocity slots, e.g. tf.bfloat16 to halve their memory
+        # traffic. The update itself is always computed in the variable dtype.
+        self.state_dtype = None if state_dtype is None else tf.as_dtype(state_dtype)
 
     def build(self, var_list):
         """Initialize optimizer variables.
@@ -67,79 +189,207 @@ class AdalphaBase(Optimizer):
         if hasattr(self, "_built") and self._built:
             return
         self._built = True
+        # Running beta_1**t and beta_2**t, advanced once per step instead of a tf.pow per variable.
+        self._beta_1_power = self.add_variable(shape=(), initializer="ones", name="beta_1_power")
+        self._beta_2_power = self.add_variable(shape=(), initializer="ones", name="beta_2_power")
         self._momentums = []
         self._velocities = []
         for var in var_list:
-            self._momentums.append(
-                self.add_variable_from_reference(
-                    model_variable=var, variable_name="m"
-                )
-            )
-            self._velocities.append(
-                self.add_variable_from_reference(
-                    model_variable=var, variable_name="v"
-                )
-            )
+            self._momentums.append(self._add_slot(var, "m"))
+            self._velocities.append(self._add_slot(var, "v"))
         if self.amsgrad:
             self._velocity_hats = []
             for var in var_list:
-                self._velocity_hats.append(
-                    self.add_variable_from_reference(
-                        model_variable=var, variable_name="vhat"
-                    )
-                )
+                self._velocity_hats.append(self._add_slot(var, "vhat"))
+        # One lookup per variable in update_step instead of the index dict plus a list per slot.
+        v_hats = self._velocity_hats if self.amsgrad else [None] * len(var_list)
+        self._slot_map = {
+            self._var_key(var): (m, v, v_hat)
+            for var, m, v, v_hat in zip(var_list, self._momentums, self._velocities, v_hats)
+        }
+        # (1 - beta_1, 1 - beta_2, epsilon**2) as constants of each variable dtype, keyed by dtype name.
+        # epsilon**2 stays float32 for float16 variables, see _rsqrt_update.
+        self._constants = {
+            dtype.name: (
+                tf.constant(self._omb1, dtype),
+                tf.constant(self._omb2, dtype),
+                tf.constant(self._eps_sq, tf.float32 if dtype == tf.float16 else dtype),
+            )
+            for dtype in {var.dtype for var in var_list}
+        }
+        # The learning rate in each variable dtype, refreshed once per step in _distributed_apply_gradients_fn.
+        self._lr_cache = {
+            dtype.name: self.add_variable(shape=(), dtype=dtype, name=f"learning_rate_{dtype.name}")
+            for dtype in {var.dtype for var in var_list}
+        }
 
-    def update_loss(self, loss: float):
-        self.a = self.ema_w * loss + (1 - self.ema_w) * self.a
-        self.b = (1 - self.ema_w) * loss + self.ema_w * self.b
-        new_std=(self.change * self.a) / self.b
-        self.std = new_std
+    def _add_slot(self, var, name):
+        """Create a zero slot for var, stored in state_dtype when one was given."""
+        if self.state_dtype is None or self.state_dtype == var.dtype:
+            return self.add_variable_from_reference(model_variable=var, variable_name=name)
+        # Same placement and naming as add_variable_from_reference, which cannot take a different dtype.
+        with tf.distribute.get_strategy().extended.colocate_vars_with(var):
+            return self.add_variable(shape=var.shape, dtype=self.state_dtype, name=f"{name}/{var._shared_name}")
 
-    def update_step(self, gradient, variable):
-        """Update step given gradient and the associated model variable."""
-        beta_1_power = None
-        beta_2_power = None
-        lr = tf.cast(self.learning_rate, variable.dtype)
-        local_step = tf.cast(self.iterations + 1, variable.dtype)
-        beta_1_power = tf.pow(tf.cast(self.beta_1, variable.dtype), local_step)
-        beta_2_power = tf.pow(tf.cast(self.beta_2, variable.dtype), local_step)
+    def _internal_apply_gradients(self, grads_and_vars):
+        """Reject DTensor, whose apply path skips _distributed_apply_gradients_fn and so would never
+        advance the per-step state (beta powers, cached learning rates) that update_step reads.
+        """
+        if getattr(self, "_mesh", None) is not None or getattr(self, "_run_with_dtensor", False):
+            raise NotImplementedError(
+                f"{self.__class__.__name__} does not support DTensor meshes: its per-step state is only "
+                "advanced in _distributed_apply_gradients_fn, which the DTensor path does not call."
+            )
+        return super()._internal_apply_gradients(grads_and_vars)
 
-        var_key = self._var_key(variable)
-        m = self._momentums[self._index_dict[var_key]]
-        v = self._velocities[self._index_dict[var_key]]
+    def _distributed_apply_gradients_fn(self, distribution, grads_and_vars, **kwargs):
+        """Advance the bias correction powers and refresh the cached learning rates once per step,
+        then apply the per-variable updates.
+        """
+        self._beta_1_power.assign(self._beta_1_power * self.beta_1)
+        self._beta_2_power.assign(self._beta_2_power * self.beta_2)
+        lr = self.learning_rate
+        for lr_var in self._lr_cache.values():
+            lr_var.assign(tf.cast(lr, lr_var.dtype))
+        if self._supports_flat_update and not self.use_ema and not tf.distribute.has_strategy():
+            grads_and_vars = list(grads_and_vars)
+            self._flat_dense_step(
+                [(g, var) for g, var in grads_and_vars if not isinstance(g, tf.IndexedSlices)]
+            )
+            grads_and_vars = [(g, var) for g, var in grads_and_vars if isinstance(g, tf.IndexedSlices)]
+        return super()._distributed_apply_gradients_fn(distribution, grads_and_vars, **kwargs)
+
+    def _flat_dense_step(self, grads_and_vars):
+        """Apply all dense gradients as one fused update per dtype over flattened, concatenated buffers.
+        :param grads_and_vars: list of (gradient, variable) pairs with dense gradients
+        :return: None
+        """
+        by_dtype = {}
+        for g, var in grads_and_vars:
+            by_dtype.setdefault(var.dtype, []).append((g, var))
 
-        alpha = lr * (tf.sqrt(1 - beta_2_power) / (1 - beta_1_power)) * (
-                    1 - self.std * self.chaos_punish) ** self.chaos_punish
+        flat_step = self._flat_kernels[bool(self.jit_compile)]
+        for dtype, pairs in by_dtype.items():
+            grads = [g for g, _ in pairs]
+            variables = [var for _, var in pairs]
+            ms, vs, v_hats = zip(*[self._slot_map[self._var_key(var)] for var in variables])
+            omb1, omb2, eps_sq = self._constants[dtype.name]
 
-        if isinstance(gradient, tf.IndexedSlices):
-            # Sparse gradients.
-            m.assign_add(-m * (1 - self.beta_1))
-            m.scatter_add(
-                tf.IndexedSlices(
-                    gradient.values * (1 - self.beta_1), gradient.indices
-                )
-            )
-            v.assign_add(-v * (1 - self.beta_2))
-            v.scatter_add(
-                tf.IndexedSlices(
-                    tf.square(gradient.values) * (1 - self.beta_2),
-                    gradient.indices,
-                )
+            new_ms, new_vs, new_v_hats, deltas = flat_step(
+                grads,
+                [m.read_value() for m in ms],
+                [v.read_value() for v in vs],
+                [v_hat.read_value() for v_hat in v_hats] if self.amsgrad else None,
+                self._alpha(dtype), omb1, omb2, eps_sq,
             )
             if self.amsgrad:
-                v_hat = self._velocity_hats[self._index_dict[var_key]]
-                v_hat.assign(tf.maximum(v_hat, v))
-                v = v_hat
-            variable.assign_sub((m * alpha) / (tf.sqrt(v) + self.epsilon))
+                for v_hat, value in zip(v_hats, new_v_hats):
+                    v_hat.assign(value)
+            for m, v, m_value, v_value in zip(ms, vs, new_ms, new_vs):
+                m.assign(m_value)
+                v.assign(v_value)
+
+            # The writes run outside XLA, where a guard on alpha would cost a host sync every step: write
+            # unconditionally.
+            for var, delta in zip(variables, deltas):
+                var.assign_sub(delta)
+
+    def update_loss(self, loss: float):
+        self.a, self.b, new_std = _ema_step(float(loss), self.a, self.b, self.ema_w, self.change)
+        self.std.assign(new_std)
+        self._chaos_factor.assign(self._compute_chaos_factor(new_std))
+
+    def _compute_chaos_factor(self, std):
+        """The factor alpha is scaled by for a loss ratio of std: (1 - L*adjustment_exp)**adjustment_exp.
+        Computed on the host in float32; a negative base with a fractional exponent gives NaN, as tf.pow would.
+        :param std: the loss ratio, as a Python float
+        :return: the factor as a float32 scalar
+        """
+        with np.errstate(invalid="ignore"):
+            return np.power(np.float32(1 - std * self.chaos_punish), np.float32(self.chaos_punish))
+
+    def _apply_unless_zero(self, alpha, update, *args):
+        """Call update(*args), skipping it when the step size is zero, since a zero alpha makes it a no-op.
+        The skip is only taken under XLA, where the predicate stays on the device; elsewhere a GPU If would
+        sync with the host on every step, which costs more than the write it saves.
+        :param alpha: scalar step size Tensor
+        :param update: the variable update to guard, e.g. variable.assign_sub
+        :return: None
+        """
+        if not self.jit_compile:
+            update(*args)
+            return
+
+        def apply():
+            update(*args)
+
+        tf.cond(tf.not_equal(alpha, 0), apply, lambda: None)
+
+    def _alpha(self, dtype):
+        """Step size for this step, including the chaos factor."""
+        lr = self._lr_cache[dtype.name]
+        beta_1_power = tf.cast(self._beta_1_power, dtype)
+        beta_2_power = tf.cast(self._beta_2_power, dtype)
+        alpha = lr * (tf.sqrt(1 - beta_2_power) / (1 - beta_1_power))
+        if self.chaos_punish == 0:
+            # The chaos term is identically 1, so this is plain Adam; leave it out of the graph.
+            return alpha
+        return alpha * tf.cast(self._chaos_factor, dtype)
+
+    @property
+    def _fused_step(self):
+        """The fused kernel, XLA compiled only when Keras enabled jit_compile for this optimizer."""
+        return self._fused_kernels[bool(self.jit_compile)]
+
+    def update_step(self, gradient, variable):
+        """Update step given gradient and the associated model variable.
+        The sparse/dense choice is made while Keras traces this step, once per variable.
+        """
+        m, v, v_hat = self._slot_map[self._var_key(variable)]
+        alpha = self._alpha(variable.dtype)
+        if isinstance(gradient, tf.IndexedSlices):
+            self._sparse_step(gradient, variable, m, v, v_hat, alpha)
         else:
-            # Dense gradients.
-            m.assign_add((gradient - m) * (1 - self.beta_1))
-            v.assign_add((tf.square(gradient) - v) * (1 - self.beta_2))
-            if self.amsgrad:
-                v_hat = self._velocity_hats[self._index_dict[var_key]]
-                v_hat.assign(tf.maximum(v_hat, v))
-                v = v_hat
-            variable.assign_sub((m * alpha) / (tf.sqrt(v) + self.epsilon))
+            self._dense_step(gradient, variable, m, v, v_hat, alpha)
+
+    def _sparse_step(self, gradient, variable, m, v, v_hat, alpha):
+        """Lazy update for sparse gradients: only the rows in gradient.indices are touched.
+        For Adalpha the activation statistics are taken over those rows.
+        """
+        dtype = variable.dtype
+        omb1, omb2, eps_sq = self._constants[dtype.name]
+        # Keras' apply_gradients has already summed repeated indices, so each row appears once.
+        values, indices = gradient.values, gradient.indices
+        m_slice = tf.cast(tf.gather(m, indices), dtype)
+        v_slice = tf.cast(tf.gather(v, indices), dtype)
+        # Same math as the dense kernel, traced inline into the update step rather than called as a nested
+        # tf.function. This does not avoid recompilation: under jit_compile the update step itself is
+        # XLA-compiled, so each distinct number of rows still gets its own compilation.
+        m_new, v_new, delta = self._fused_step.python_function(values, m_slice, v_slice, alpha, omb1, omb2, eps_sq)
+        m.scatter_update(tf.IndexedSlices(tf.cast(m_new, m.dtype), indices))
+        v.scatter_update(tf.IndexedSlices(tf.cast(v_new, v.dtype), indices))
+        if v_hat is not None:
+            v_new = tf.maximum(tf.cast(tf.gather(v_hat, indices), dtype), v_new)
+            v_hat.scatter_update(tf.IndexedSlices(tf.cast(v_new, v_hat.dtype), indices))
+            delta = _rsqrt_update(m_new * alpha, v_new, eps_sq)
+        self._apply_unless_zero(alpha, variable.scatter_sub, tf.IndexedSlices(delta, indices))
+
+    def _dense_step(self, gradient, variable, m, v, v_hat, alpha):
+        """Fused update for dense gradients."""
+        dtype = variable.dtype
+        omb1, omb2, eps_sq = self._constants[dtype.name]
+        # Pass the slot values, not the slot variables: the kernels are shared by every optimizer instance,
+        # and a trace that captured one optimizer's slots would be reused for the next one's.
+        m_t, v_t, delta = self._fused_step(
+            gradient, tf.cast(m.read_value(), dtype), tf.cast(v.read_value(), dtype), alpha, omb1, omb2, eps_sq
+        )
+        m.assign(tf.cast(m_t, m.dtype))
+        v.assign(tf.cast(v_t, v.dtype))
+        if v_hat is not None:
+            v_hat_t = tf.maximum(tf.cast(v_hat.read_value(), dtype), v_t)
+            v_hat.assign(tf.cast(v_hat_t, v_hat.dtype))
+            delta = _rsqrt_update(m_t * alpha, v_hat_t, eps_sq)
+        self._apply_unless_zero(alpha, variable.assign_sub, delta)
 
     def get_config(self):
         config = super().get_config()
@@ -153,6 +403,7 @@ class AdalphaBase(Optimizer):
                 "beta_2": self.beta_2,
                 "epsilon": self.epsilon,
                 "amsgrad": self.amsgrad,
+                "state_dtype": None if self.state_dtype is None else self.state_dtype.name,
             }
         )
         return config
@@ -170,6 +421,10 @@ class Adalpha(AdalphaBase):
     2: Adalpha adjusts the momentum and velocity of all weights using the function
     out = m * (1.91 - (m**2-(0.01*(|mean(m)| + std(m)))/(m**2 + 0.1 * (|mean(m)| + std(m))**2)))
     """
+    # The activation normalizes by per-variable statistics, so variables cannot share one flat buffer.
+    _supports_flat_update = False
+    _fused_kernels = _kernels(_adalpha_step)
+
     def __init__(self, *args, **kwargs):
         """
         Initiator function
@@ -182,54 +437,12 @@ class Adalpha(AdalphaBase):
         :praram m: the value being activated, any Tensorflow.math compatible Tensorflow Tensor
         :return: the activated value - Tensorflow Tensor of same input type
         """
-        return m * tf.pow(2 - tf.math.divide_no_nan((tf.square(m) - tf.square(0.01 * tf.abs(tf.abs(tf.reduce_mean(m)) -
-                                                                                            tf.math.reduce_std(m)))),
-                                                 (tf.square(m) + 0.1 * tf.square(tf.abs(tf.reduce_mean(m)) -
-                                                                                 tf.math.reduce_std(m)))), 2)
+        return _m_activ(m)
 
-    def update_step(self, gradient, variable):
-        """Update step given gradient and the associated model variable."""
-        beta_1_power = None
-        beta_2_power = None
-        lr = tf.cast(self.learning_rate, variable.dtype)
-        local_step = tf.cast(self.iterations + 1, variable.dtype)
-        beta_1_power = tf.pow(tf.cast(self.beta_1, variable.dtype), local_step)
-        beta_2_power = tf.pow(tf.cast(self.beta_2, variable.dtype), local_step)
-
-        var_key = self._var_key(variable)
-        m = self._momentums[self._index_dict[var_key]]
-        v = self._velocities[self._index_dict[var_key]]
-        alpha = lr * (tf.sqrt(1 - beta_2_power) / (1 - beta_1_power)) * (self.std) ** self.chaos_punish
-
-        if isinstance(gradient, tf.IndexedSlices):
-            # Sparse gradients.
-            m.assign_add(self._m_activ(-m * (1 - self.beta_1)))
-            m.scatter_add(
-                tf.IndexedSlices(
-                    self._m_activ(gradient.values * (1 - self.beta_1)), gradient.indices
-                )
-            )
-            v.assign_add(self._m_activ(-v * (1 - self.beta_2)))
-            v.scatter_add(
-                tf.IndexedSlices(
-                    self._m_activ(tf.square(gradient.values) * (1 - self.beta_2)),
-                    gradient.indices,
-                )
-            )
-            if self.amsgrad:
-                v_hat = self._velocity_hats[self._index_dict[var_key]]
-                v_hat.assign(tf.maximum(v_hat, v))
-                v = v_hat
-            variable.assign_sub((m * alpha) / (tf.sqrt(v) + self.epsilon))
-        else:
-            # Dense gradients.
-            m.assign_add(self._m_activ((gradient - m) * (1 - self.beta_1)))
-            v.assign_add(self._m_activ((tf.square(gradient) - v) * (1 - self.beta_2)))
-            if self.amsgrad:
-                v_hat = self._velocity_hats[self._index_dict[var_key]]
-                v_hat.assign(tf.maximum(v_hat, v))
-                v = v_hat
-            variable.assign_sub((m * alpha) / (tf.sqrt(v) + self.epsilon))
+    def _compute_chaos_factor(self, std):
+        """The factor alpha is scaled by for a loss ratio of std: L**adjustment_exp."""
+        with np.errstate(invalid="ignore"):
+            return np.power(np.float32(std), np.float32(self.chaos_punish))
 
 
 class AdalphaCallback(tf.keras.callbacks.Callback):
@@ -248,23 +461,33 @@ class AdalphaCallback(tf.keras.callbacks.Callback):
 class AdalphaPlot(AdalphaCallback):
     def __init__(self, optimizer: Adalpha):
         super().__init__(optimizer)
-        self.stds = [0]
+        # Preallocated and grown by doubling, so recording every batch stays cheap on long runs.
+        self.stds = np.zeros(1024, dtype=np.float32)
+        self._n = 1
 
-    def _calculate_loss_std(self, loss):
-        self.a = self.optimizer.ema_w * loss + (1-self.optimizer.ema_w) * self.optimizer.a
-        self.b = (1 - self.optimizer.ema_w) * loss + self.optimizer.ema_w * self.optimizer.b
-        self.stds.append(self.optimizer.learning_rate * (self.optimizer.change * self.a)/self.b)
+    def _calculate_loss_std(self):
+        """Record the alpha scale the optimizer uses now; call after update_loss."""
+        if self._n == len(self.stds):
+            self.stds = np.resize(self.stds, 2 * len(self.stds))
+        self.stds[self._n] = float(self.optimizer.learning_rate) * float(self.optimizer.std)
+        self._n += 1
+
+    def on_train_batch_end(self, batch, logs=None):
+        super().on_train_batch_end(batch, logs)
+        self._calculate_loss_std()
 
     def on_train_end(self, logs=None):
-        loss = logs["loss"]
-        self.optimizer.update_loss(loss)
-        self._calculate_loss_std(loss)
+        self.optimizer.update_loss(logs["loss"])
+        self._calculate_loss_std()
+        stds = self.stds[:self._n]
+        # Downsample so matplotlib only ever draws a few thousand points.
+        stride = max(1, self._n // 5000)
 
         plt.clf()
         plt.title(f"Adalpha Alpha, ema_w = {self.optimizer.ema_w}, change = {self.optimizer.change}")
-        plt.plot(self.stds, "r-", label="Adalpha Alpha")
+        plt.plot(np.arange(0, self._n, stride), stds[::stride], "r-", label="Adalpha Alpha")
         plt.xlabel("Batch")
         plt.ylabel("Alpha")
         plt.legend()
         plt.show()
-        print(f"Ema_w = {self.optimizer.ema_w}, Change = {self.optimizer.change}, r mean = {np.mean(self.stds)/self.optimizer.learning_rate}")
+        print(f"Ema_w = {self.optimizer.ema_w}, Change = {self.optimizer.change}, r mean = {np.mean(stds)/self.optimizer.learning_rate}")
@@ -1,3 +1,4 @@
+import gc
 import matplotlib.pyplot as plt
 
 from Adalpha.test_files.tests_core import *
@@ -734,6 +735,37 @@ def cartpole_change_test(callback,
     if copy:
         pd.DataFrame(results).to_clipboard(excel=True)
 
+def repeated_optimizer_test(callback=AA.AdalphaCallback, optimizer=AA.Adalpha, runs=3, epochs=2):
+    """
+    Trains several fresh models in one process, each with a new optimizer, to check that an optimizer
+    built later does not reuse state from an earlier, garbage collected one.
+
+    Parameters:
+        callback (object): The callback class to use.
+        optimizer (object): The optimizer class to use.
+        runs (int): The number of models to train one after another.
+        epochs (int): The number of epochs to train each model for.
+
+    Returns:
+        list: The final training loss of each run.
+    """
+    x_data = np.random.rand(256, 8).astype(np.float32)
+    y_data = np.random.rand(256, 1).astype(np.float32)
+    losses = []
+    for i in range(runs):
+        model = tf.keras.Sequential([tf.keras.layers.Input(shape=(8,)),
+                                     tf.keras.layers.Dense(16, activation="relu"),
+                                     tf.keras.layers.Dense(1)])
+        opt = optimizer()
+        model.compile(optimizer=opt, loss="mse")
+        history = model.fit(x_data, y_data, epochs=epochs, batch_size=32, callbacks=[callback(opt)], verbose=False)
+        losses.append(history.history["loss"][-1])
+        assert np.isfinite(losses[-1]), f"Run {i} produced a non-finite loss: {losses[-1]}"
+        del model, opt, history
+        gc.collect()
+    return losses
+
+
 def run_all_tests_for_paper():
     mnist_multiple_test(AA.Adalpha_Callback, AA.Adalpha_Momentum, epochs=10, learning_rate=0.001, adjustment_exp=2,
                         ema_w=0.9, change=0.99, copy=True, tests=10)